@@ -4,14 +4,24 @@ from google.genai import types
 from PIL import Image
 from io import BytesIO
 import os
+import asyncio
+import hashlib
+import io
 import json
+import queue
+import re
+import secrets
+import tarfile
+import threading
+import time
 import uuid
-from typing import List, Dict, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import IO, Iterator, List, Dict, Optional, Set, Tuple
 
-from fastapi import FastAPI, HTTPException, Body, Path as FastApiPath
+from fastapi import FastAPI, HTTPException, Body, Depends, Header, Request, Path as FastApiPath
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv # For .env file if used
 from fastapi.middleware.cors import CORSMiddleware
 # --- Load Environment Variables (Optional, if using .env) ---
@@ -21,9 +31,11 @@ load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_OUTPUT_DIR = os.path.join(BASE_DIR, "generated_comics_panels")
 STORY_JSON_DIR = os.path.join(BASE_DIR, "comic_stories_json")
+IMPORT_STAGING_DIR = os.path.join(BASE_DIR, "import_staging") # Not served; holds images being imported until verified
 
 os.makedirs(IMAGE_OUTPUT_DIR, exist_ok=True)
 os.makedirs(STORY_JSON_DIR, exist_ok=True)
+os.makedirs(IMPORT_STAGING_DIR, exist_ok=True)
 
 # --- Prerequisites: API Key Configuration ---
 try:
@@ -40,6 +52,11 @@ except Exception as e:
     print(f"🔴 FATAL: Error configuring Gemini: {e}")
     exit()
 
+# --- Admin Token for /admin endpoints (export/import are disabled when unset) ---
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+if not ADMIN_TOKEN:
+    print("⚠️ Warning: ADMIN_TOKEN not set. /admin endpoints are disabled.")
+
 # --- LLM Configuration ---
 TEXT_MODEL_NAME = "gemini-1.5-flash-latest"
 try:
@@ -84,6 +101,180 @@ def save_story_to_json(story_id: str, panels_data: List[Dict[str, str]]) -> None
     except Exception as e:
         print(f"🔴 Error saving story {filepath}: {e}")
 
+# --- Structured Output Helpers for Panel Refinement ---
+REFINEMENT_EXPECTED_KEYS = ["ai_narration", "ai_dialogue", "ai_visual_prompt", "ai_sound_effect"]
+# Keys that must also carry non-empty text; the others may legitimately be "None".
+REFINEMENT_NON_EMPTY_KEYS = ["ai_narration", "ai_visual_prompt"]
+
+# Counters for how the refinement responses were parsed, exposed via /stats/refinement.
+# "failed" only covers parse/missing-field failures; API errors and blocked prompts go to "api_errors".
+refinement_parse_stats: Dict[str, int] = {
+    "calls": 0,
+    "parsed_first_try": 0,
+    "repaired": 0,
+    "unparseable": 0,
+    "retried_missing_fields": 0,
+    "failed": 0,
+    "api_errors": 0,
+}
+
+def build_refinement_generation_config(keys: List[str]) -> genai_LLMs.GenerationConfig:
+    """
+    Builds a JSON-mode generation config whose response schema only contains the given keys,
+    so the model is constrained to return exactly those string fields.
+    """
+    response_schema = {
+        "type": "object",
+        "properties": {key: {"type": "string"} for key in keys},
+        "required": list(keys),
+    }
+    return genai_LLMs.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=response_schema
+    )
+
+CLOSING_BRACKET_AHEAD = re.compile(r"\s*[}\]]")
+
+def strip_trailing_commas_outside_strings(text: str) -> str:
+    """Removes commas directly before a closing } or ], ignoring anything inside JSON strings."""
+    result = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "," and CLOSING_BRACKET_AHEAD.match(text, i + 1):
+            continue
+        result.append(ch)
+    return "".join(result)
+
+def scan_top_level_json_object(text: str) -> Tuple[int, List[int], bool]:
+    """
+    Walks a JSON object that starts at text[0], skipping over string contents.
+    Returns the index of its closing brace (-1 if the text ends first), the positions of the
+    commas that end each top-level member, and whether the text ends inside a string.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    member_ends = []
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return i, member_ends, False
+        elif ch == "," and depth == 1:
+            member_ends.append(i)
+    return -1, member_ends, in_string
+
+def parse_llm_json_tolerantly(raw_text: str) -> Tuple[Optional[Dict[str, str]], bool]:
+    """
+    Parses a JSON object out of an LLM response, repairing common near-valid output
+    (markdown fences, surrounding prose, smart quotes, trailing commas). Truncated output
+    keeps only its complete members; the cut-off one is left out so it shows up as missing.
+    Returns the parsed object (or None) and whether a repair was needed.
+    """
+    text = (raw_text or "").strip()
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed, False
+    except json.JSONDecodeError:
+        pass
+
+    # Strip ```json fences and any prose before the object
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text, flags=re.IGNORECASE).strip()
+    first_brace = text.find("{")
+    if first_brace == -1:
+        return None, False
+    text = text[first_brace:]
+
+    # Smart quotes count as JSON delimiters only next to {, }, : or , so quotes inside values survive
+    quote_normalized_text = re.sub(r"([{,:]\s*)[\u201c\u201d]", r'\1"', text)
+    quote_normalized_text = re.sub(r"[\u201c\u201d](\s*[}:,])", r'"\1', quote_normalized_text)
+
+    candidates = []
+    for base_text in dict.fromkeys([text, quote_normalized_text]):
+        object_end, member_ends, ends_in_string = scan_top_level_json_object(base_text)
+        if object_end != -1:
+            complete_texts = [base_text[:object_end + 1]] # Drops any prose after the object
+        else:
+            # Truncated output: keep only the members that were completed, so a cut-off
+            # value becomes a missing key for the targeted retry instead of being accepted
+            complete_texts = [] if ends_in_string else [base_text.rstrip() + "}"]
+            complete_texts += [base_text[:member_end] + "}" for member_end in reversed(member_ends)]
+        for complete_text in complete_texts:
+            candidates.append(complete_text)
+            candidates.append(strip_trailing_commas_outside_strings(complete_text))
+
+    for candidate in candidates:
+        try:
+            parsed = json.loads(candidate, strict=False)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(parsed, dict):
+            return parsed, True
+    return None, False
+
+def get_missing_refinement_keys(refined_elements: Dict[str, str]) -> List[str]:
+    missing_keys = []
+    for key in REFINEMENT_EXPECTED_KEYS:
+        value = refined_elements.get(key)
+        if not isinstance(value, str) or (key in REFINEMENT_NON_EMPTY_KEYS and not value.strip()):
+            missing_keys.append(key)
+    return missing_keys
+
+def request_missing_refinement_fields(
+    original_prompt: str,
+    partial_elements: Dict[str, str],
+    missing_keys: List[str]
+) -> Optional[Dict[str, str]]:
+    """
+    Makes one follow-up call that asks the text model only for the missing fields,
+    keeping the fields it already produced as fixed context.
+    Returns None if the call itself failed, and an empty dict if its output could not be parsed.
+    """
+    known_fields = {k: v for k, v in partial_elements.items() if k in REFINEMENT_EXPECTED_KEYS and k not in missing_keys}
+    retry_prompt = f"""
+    {original_prompt}
+
+    You already produced part of the answer for this panel:
+    {json.dumps(known_fields, indent=2)}
+
+    Keep those fields as they are. Respond ONLY with a JSON object containing these missing keys: {', '.join(missing_keys)}.
+    """
+    try:
+        response = text_model.generate_content(
+            retry_prompt,
+            generation_config=build_refinement_generation_config(missing_keys)
+        )
+        retried_elements, _ = parse_llm_json_tolerantly(response.text)
+    except Exception as e:
+        print(f"🔴 Error during targeted retry for missing fields {missing_keys}: {e}")
+        return None
+    if retried_elements is None:
+        print(f"🔴 Error: Could not parse JSON from targeted retry. LLM Raw Text was: {response.text}")
+        return {}
+    return {k: v for k, v in retried_elements.items() if k in missing_keys}
+
 def refine_story_and_create_visual_prompt(
     user_input: str,
     previous_panels_data: List[Dict[str, str]]
@@ -144,21 +335,44 @@ def refine_story_and_create_visual_prompt(
     Ensure the JSON is valid.
     """
     try:
-        print(f"   Sending prompt to {TEXT_MODEL_NAME} (with sound effect request)...")
-        response = text_model.generate_content(prompt)
-        cleaned_response_text = response.text.strip().removeprefix("```json").removesuffix("```").strip()
-        
-        refined_elements = json.loads(cleaned_response_text)
-
-        # VALIDATE ALL EXPECTED KEYS
-        expected_keys = ["ai_narration", "ai_dialogue", "ai_visual_prompt", "ai_sound_effect"]
-        if not all(k in refined_elements for k in expected_keys):
-            print(f"🔴 Error: LLM response missing required JSON keys. Expected: {expected_keys}, Got: {list(refined_elements.keys())}")
+        print(f"   Sending prompt to {TEXT_MODEL_NAME} (structured output, with sound effect request)...")
+        refinement_parse_stats["calls"] += 1
+        response = text_model.generate_content(
+            prompt,
+            generation_config=build_refinement_generation_config(REFINEMENT_EXPECTED_KEYS)
+        )
+        refined_elements, was_repaired = parse_llm_json_tolerantly(response.text)
+        if refined_elements is None:
+            print(f"⚠️ Warning: Could not parse JSON from LLM response, even after repair.")
             print(f"   LLM Raw Text was: {response.text}")
-            return None
-        
+            refinement_parse_stats["unparseable"] += 1
+            refined_elements = {}
+        elif was_repaired:
+            refinement_parse_stats["repaired"] += 1
+            print("   🩹 LLM response was near-valid JSON and has been repaired.")
+
+        # VALIDATE ALL EXPECTED KEYS, asking again only for the ones that are missing
+        missing_keys = get_missing_refinement_keys(refined_elements)
+        if missing_keys:
+            refinement_parse_stats["retried_missing_fields"] += 1
+            print(f"   🔁 LLM response missing keys {missing_keys}. Requesting only those fields...")
+            retried_elements = request_missing_refinement_fields(prompt, refined_elements, missing_keys)
+            if retried_elements is None:
+                refinement_parse_stats["api_errors"] += 1
+                return None
+            refined_elements.update(retried_elements)
+            missing_keys = get_missing_refinement_keys(refined_elements)
+            if missing_keys:
+                refinement_parse_stats["failed"] += 1
+                print(f"🔴 Error: LLM response still missing required JSON keys after retry. Expected: {REFINEMENT_EXPECTED_KEYS}, Missing: {missing_keys}")
+                return None
+        elif not was_repaired:
+            refinement_parse_stats["parsed_first_try"] += 1
+
+        refined_elements = {k: refined_elements.get(k) for k in REFINEMENT_EXPECTED_KEYS}
+
         # Normalize "None" string for sound effect if necessary
-        if isinstance(refined_elements.get("ai_sound_effect"), str) and refined_elements["ai_sound_effect"].strip().lower() == "none":
+        if isinstance(refined_elements.get("ai_sound_effect"), str) and refined_elements["ai_sound_effect"].strip().lower() in ("none", ""):
             refined_elements["ai_sound_effect"] = None 
 
         print("   ✅ LLM (Text Refinement + Sound Effect) processing successful.")
@@ -168,11 +382,8 @@ def refine_story_and_create_visual_prompt(
         print(f"   ↪ Sound Effect: {refined_elements.get('ai_sound_effect')}") 
         return refined_elements
 
-    except json.JSONDecodeError as e:
-        print(f"🔴 Error: Failed to decode JSON from LLM response: {e}")
-        print(f"   LLM Raw Text was: {response.text if 'response' in locals() else 'N/A'}")
-        return None
     except Exception as e:
+        refinement_parse_stats["api_errors"] += 1
         block_reason = getattr(getattr(response, 'prompt_feedback', None), 'block_reason', None) if 'response' in locals() else None
         if block_reason:
             print(f"🔴 Error: Gemini Pro request was blocked. Reason: {block_reason}")
@@ -215,10 +426,106 @@ def generate_comic_image_with_client(
         print(f"🔴 Error during image generation: {e}")
         return None
 
+# --- Parallel Multi-Candidate Image Generation ---
+IMAGE_GENERATION_WORKERS = 8
+# At most half the pool per request, so one request's candidates cannot starve the next one
+MAX_IMAGE_CANDIDATES = IMAGE_GENERATION_WORKERS // 2
+DEFAULT_IMAGE_DEADLINE_SECONDS = 90.0
+image_generation_executor = ThreadPoolExecutor(max_workers=IMAGE_GENERATION_WORKERS, thread_name_prefix="image_gen")
+# Guards read-modify-write of story JSON files, since alternates are recorded from worker threads
+story_file_lock = threading.Lock()
+
+def generate_comic_image_candidates(
+    visual_prompt: str,
+    num_candidates: int,
+    deadline_seconds: float
+) -> Tuple[Optional[str], List[Future]]:
+    """
+    Fans out several concurrent image generations for the same visual prompt.
+    Returns the filename of the first successful image as soon as it is available,
+    together with the still-running (or finished) futures of the other candidates.
+    """
+    print(f"\n🎲 Generating {num_candidates} image candidates (deadline {deadline_seconds}s)")
+    futures = [
+        image_generation_executor.submit(generate_comic_image_with_client, visual_prompt)
+        for _ in range(num_candidates)
+    ]
+    first_future = None
+    try:
+        for future in as_completed(futures, timeout=deadline_seconds):
+            if future.result():
+                first_future = future
+                break
+    except FuturesTimeoutError:
+        print(f"🔴 Error: No image candidate succeeded within {deadline_seconds}s.")
+    stragglers = [f for f in futures if f is not first_future]
+    if first_future is None:
+        cancel_pending_candidates(stragglers)
+        return None, stragglers
+    return first_future.result(), stragglers
+
+def cancel_pending_candidates(futures: List[Future]) -> None:
+    """Cancels candidates still queued on the executor, so they are never sent to the image model."""
+    cancelled_count = sum(1 for future in futures if future.cancel())
+    if cancelled_count:
+        print(f"   ✋ Cancelled {cancelled_count} image candidates that had not started yet.")
+
+def discard_panel_image(image_filename: str) -> None:
+    try:
+        os.remove(os.path.join(IMAGE_OUTPUT_DIR, image_filename))
+        print(f"   🗑️ Discarded image candidate {image_filename} that has no panel to attach to")
+    except OSError as e:
+        print(f"⚠️ Warning: Could not remove image {image_filename}: {e}")
+
+def discard_image_candidate(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None and future.result():
+        discard_panel_image(future.result())
+
+def add_alternate_image_to_panel(story_id: str, panel_number: int, image_filename: str) -> bool:
+    with story_file_lock:
+        panels = load_story_from_json(story_id)
+        for panel in panels:
+            if panel.get("panel_number") == panel_number:
+                panel.setdefault("alternate_image_urls", []).append(f"/static/panels/{image_filename}")
+                save_story_to_json(story_id, panels)
+                print(f"   🖼️ Alternate image recorded for panel {panel_number} of story '{story_id}'")
+                return True
+    return False
+
+def collect_alternate_images(
+    story_id: str,
+    panel_number: int,
+    stragglers: List[Future],
+    deadline: float
+) -> None:
+    """
+    Records images from the remaining candidates as alternates of the panel once they finish,
+    even after the deadline since they are already paid for. Candidates that have not started
+    by the deadline are cancelled.
+    """
+    def on_candidate_done(future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        image_filename = future.result()
+        if not image_filename:
+            return
+        if not add_alternate_image_to_panel(story_id, panel_number, image_filename):
+            discard_panel_image(image_filename)
+
+    for future in stragglers:
+        future.add_done_callback(on_candidate_done)
+
+    if any(not future.done() for future in stragglers):
+        deadline_timer = threading.Timer(max(0.0, deadline - time.monotonic()), cancel_pending_candidates, args=(stragglers,))
+        deadline_timer.daemon = True
+        deadline_timer.start()
+
 # --- Core Panel Creation Logic ---
 def create_new_comic_panel_logic(
     story_id: str,
-    user_story_input: str
+    user_story_input: str,
+    num_image_candidates: int = 1,
+    image_deadline_seconds: Optional[float] = None
 ) -> Optional[Dict[str, str]]: 
     print(f"\n🆕 Processing panel for story '{story_id}', user input: '{user_story_input}'")
     current_story_panels = load_story_from_json(story_id)
@@ -226,25 +533,72 @@ def create_new_comic_panel_logic(
     refined_elements = refine_story_and_create_visual_prompt(user_story_input, current_story_panels)
     if not refined_elements: return None
 
-    image_filename = generate_comic_image_with_client(refined_elements["ai_visual_prompt"])
-    if not image_filename: return None
+    stragglers: List[Future] = []
+    # A single candidate without a deadline keeps the plain blocking call; otherwise go through the executor
+    if num_image_candidates > 1 or image_deadline_seconds:
+        deadline_seconds = image_deadline_seconds or DEFAULT_IMAGE_DEADLINE_SECONDS
+        deadline = time.monotonic() + deadline_seconds
+        image_filename, stragglers = generate_comic_image_candidates(
+            refined_elements["ai_visual_prompt"], num_image_candidates, deadline_seconds
+        )
+        if not image_filename:
+            # No panel to attach late candidates to, so discard whatever still arrives
+            for future in stragglers:
+                future.add_done_callback(discard_image_candidate)
+            return None
+    else:
+        image_filename = generate_comic_image_with_client(refined_elements["ai_visual_prompt"])
+        if not image_filename: return None
 
     image_url = f"/static/panels/{image_filename}" 
 
-    new_panel_data = {
-        "panel_number": len(current_story_panels) + 1,
-        "user_input": user_story_input,
-        "ai_narration": refined_elements["ai_narration"],
-        "ai_dialogue": refined_elements.get("ai_dialogue"), 
-        "ai_visual_prompt": refined_elements["ai_visual_prompt"],
-        "ai_sound_effect": refined_elements.get("ai_sound_effect"), 
-        "image_url": image_url,
-    }
-    current_story_panels.append(new_panel_data)
-    save_story_to_json(story_id, current_story_panels)
+    with story_file_lock:
+        # Reload so alternates recorded for earlier panels while we were generating are kept
+        current_story_panels = load_story_from_json(story_id)
+        new_panel_data = {
+            "panel_number": len(current_story_panels) + 1,
+            "user_input": user_story_input,
+            "ai_narration": refined_elements["ai_narration"],
+            "ai_dialogue": refined_elements.get("ai_dialogue"), 
+            "ai_visual_prompt": refined_elements["ai_visual_prompt"],
+            "ai_sound_effect": refined_elements.get("ai_sound_effect"), 
+            "image_url": image_url,
+            "alternate_image_urls": [],
+        }
+        current_story_panels.append(new_panel_data)
+        save_story_to_json(story_id, current_story_panels)
     print(f"✅ New panel added to story '{story_id}' (with sound effect: {new_panel_data.get('ai_sound_effect')}) and saved!")
+
+    if stragglers:
+        collect_alternate_images(story_id, new_panel_data["panel_number"], stragglers, deadline)
     return new_panel_data
 
+def select_alternate_panel_image(
+    story_id: str,
+    panel_number: int,
+    image_url: str
+) -> Optional[Dict[str, str]]:
+    """
+    Makes one of the panel's alternate images its main image, keeping the previous
+    main image as an alternate. No text model call is involved.
+    """
+    with story_file_lock:
+        panels = load_story_from_json(story_id)
+        for panel in panels:
+            if panel.get("panel_number") != panel_number:
+                continue
+            alternates = panel.get("alternate_image_urls", [])
+            if image_url not in alternates:
+                return None
+            alternates.remove(image_url)
+            alternates.append(panel["image_url"])
+            panel["image_url"] = image_url
+            panel["alternate_image_urls"] = alternates
+            save_story_to_json(story_id, panels)
+            print(f"✅ Panel {panel_number} of story '{story_id}' now uses image {image_url}")
+            return panel
+    return None
+
 
 # --- NEW: Function for AI Director's Suggestion ---
 def get_ai_directors_suggestion(
@@ -323,6 +677,265 @@ def get_ai_directors_suggestion(
             print(f"🔴 An unexpected error occurred while getting Director's suggestion: {e}")
         return None
 
+# --- Bulk Export / Import of Stories and Panel Assets ---
+ARCHIVE_STORIES_PREFIX = "stories/"
+ARCHIVE_PANELS_PREFIX = "panels/"
+ARCHIVE_CHECKSUM_HEADER = "COMICFLOW.sha256"
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+STORY_ID_PATTERN = re.compile(r"^[a-zA-Z0-9_-]{1,50}$")
+PANEL_IMAGE_NAME_PATTERN = re.compile(r"^[a-zA-Z0-9_-]+\.png$")
+
+class _QueueReader(io.RawIOBase):
+    """Read-only file object fed with chunks (None marks the end) from another thread."""
+    def __init__(self, chunk_queue: "queue.Queue[Optional[bytes]]") -> None:
+        self._queue = chunk_queue
+        self._buffer = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def compute_file_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(ARCHIVE_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_panel_image_filenames(panels: List[Dict[str, str]]) -> List[str]:
+    filenames = []
+    for panel in panels:
+        for image_url in [panel.get("image_url")] + list(panel.get("alternate_image_urls") or []):
+            if isinstance(image_url, str) and image_url.startswith("/static/panels/"):
+                filenames.append(image_url[len("/static/panels/"):])
+    return filenames
+
+def build_tar_member_header(name: str, size: int, mtime: int, sha256: str) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.pax_headers = {ARCHIVE_CHECKSUM_HEADER: sha256}
+    return info.tobuf(tarfile.PAX_FORMAT)
+
+def tar_member_padding(size: int) -> bytes:
+    remainder = size % tarfile.BLOCKSIZE
+    return tarfile.NUL * (tarfile.BLOCKSIZE - remainder) if remainder else b""
+
+def iter_story_archive() -> Iterator[bytes]:
+    """
+    Streams a tar archive of every story JSON, each preceded by the panel images it references.
+    Each member carries its SHA-256 in a PAX header. Tar headers are written by hand and images
+    are yielded in ARCHIVE_CHUNK_SIZE pieces, so memory stays constant regardless of file size.
+    """
+    exported_images = set()
+    stories_count = 0
+    for entry in sorted(os.scandir(STORY_JSON_DIR), key=lambda e: e.name):
+        if not entry.name.endswith(".json") or not entry.is_file():
+            continue
+        with story_file_lock:
+            with open(entry.path, 'rb') as f:
+                story_bytes = f.read()
+        # Images go first so an interrupted import never leaves a story pointing at missing images
+        try:
+            panels = json.loads(story_bytes)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Warning: Exporting story {entry.name} without images, invalid JSON: {e}")
+            panels = []
+        for image_filename in get_panel_image_filenames(panels if isinstance(panels, list) else []):
+            if image_filename in exported_images or not PANEL_IMAGE_NAME_PATTERN.match(image_filename):
+                continue
+            image_path = os.path.join(IMAGE_OUTPUT_DIR, image_filename)
+            try:
+                image_file = open(image_path, 'rb')
+            except OSError as e:
+                print(f"⚠️ Warning: Skipping image {image_filename} referenced by {entry.name}: {e}")
+                continue
+            with image_file:
+                # Size and checksum come from the open file, so they match the bytes streamed below
+                image_stat = os.fstat(image_file.fileno())
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: image_file.read(ARCHIVE_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                image_file.seek(0)
+
+                yield build_tar_member_header(
+                    f"{ARCHIVE_PANELS_PREFIX}{image_filename}", image_stat.st_size, int(image_stat.st_mtime), digest.hexdigest()
+                )
+                remaining = image_stat.st_size
+                while remaining > 0:
+                    chunk = image_file.read(min(ARCHIVE_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        print(f"⚠️ Warning: Image {image_filename} shrank while exporting; its checksum will not match on import.")
+                        yield tarfile.NUL * remaining
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+                yield tar_member_padding(image_stat.st_size)
+            exported_images.add(image_filename)
+
+        yield build_tar_member_header(
+            f"{ARCHIVE_STORIES_PREFIX}{entry.name}", len(story_bytes), int(time.time()), hashlib.sha256(story_bytes).hexdigest()
+        )
+        yield story_bytes + tar_member_padding(len(story_bytes))
+        stories_count += 1
+    # End-of-archive marker: two zero blocks
+    yield tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+    print(f"   📦 Exported {stories_count} stories and {len(exported_images)} images.")
+
+def import_panel_image_from_archive(member_file: IO[bytes], image_filename: str, expected_sha256: str) -> str:
+    """
+    Streams one archived image into the (non-public) staging directory while hashing it,
+    and only moves it into IMAGE_OUTPUT_DIR once the checksum matches.
+    Returns "imported", "deduplicated", "conflict" or "checksum_mismatch".
+    """
+    image_path = os.path.join(IMAGE_OUTPUT_DIR, image_filename)
+    if os.path.exists(image_path):
+        return "deduplicated" if compute_file_sha256(image_path) == expected_sha256 else "conflict"
+
+    partial_path = os.path.join(IMPORT_STAGING_DIR, f"{image_filename}.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    try:
+        with open(partial_path, 'wb') as f:
+            for chunk in iter(lambda: member_file.read(ARCHIVE_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        if digest.hexdigest() != expected_sha256:
+            os.remove(partial_path)
+            return "checksum_mismatch"
+        os.replace(partial_path, image_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return "imported"
+
+def write_story_bytes_atomically(story_id: str, story_bytes: bytes) -> None:
+    """
+    Writes the archived story bytes unchanged through a temp file and os.replace.
+    Unlike save_story_to_json, errors are raised so the import never counts a story it did not write.
+    """
+    filepath = get_story_filepath(story_id)
+    temp_path = os.path.join(STORY_JSON_DIR, f".{story_id}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(story_bytes)
+        with story_file_lock:
+            os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    print(f"   💾 Story '{story_id}' imported to {filepath}")
+
+def import_story_archive(archive_file: IO[bytes]) -> Tuple[Dict[str, int], Optional[str]]:
+    """
+    Reads a tar archive produced by iter_story_archive member by member, verifying checksums.
+    Stories are written as-is (replacing stories with the same ID) once the images before them
+    have been verified; a story referencing an image that failed verification, or that clashes
+    with a different local image of the same name, is not written.
+    Images already present with the same content are skipped.
+    Returns the summary and, if the archive could not be read to the end, the error that stopped it.
+    Everything counted in the summary has been written even in that case. Disk errors are raised.
+    """
+    summary = {
+        "stories_imported": 0,
+        "images_imported": 0,
+        "images_deduplicated": 0,
+        "images_conflicting": 0,
+        "checksum_failures": 0,
+        "stories_skipped_missing_images": 0,
+        "skipped_members": 0,
+    }
+    failed_images: Set[str] = set()
+    try:
+        import_story_archive_members(archive_file, summary, failed_images)
+    except tarfile.TarError as e:
+        print(f"🔴 Error: Import archive ended early ({e}). Partial import: {summary}")
+        return summary, str(e)
+    except OSError as e:
+        print(f"🔴 Error: Could not write imported data ({e}). Partial import: {summary}")
+        raise
+    print(f"   📥 Import finished: {summary}")
+    return summary, None
+
+def import_story_archive_members(archive_file: IO[bytes], summary: Dict[str, int], failed_images: Set[str]) -> None:
+    with tarfile.open(fileobj=archive_file, mode="r|") as tar:
+        for member in tar:
+            expected_sha256 = member.pax_headers.get(ARCHIVE_CHECKSUM_HEADER)
+            member_file = tar.extractfile(member) if member.isfile() else None
+            if member_file is None or not expected_sha256:
+                summary["skipped_members"] += 1
+                continue
+
+            if member.name.startswith(ARCHIVE_STORIES_PREFIX) and member.name.endswith(".json"):
+                story_id = member.name[len(ARCHIVE_STORIES_PREFIX):-len(".json")]
+                story_bytes = member_file.read()
+                if not STORY_ID_PATTERN.match(story_id):
+                    summary["skipped_members"] += 1
+                    continue
+                if hashlib.sha256(story_bytes).hexdigest() != expected_sha256:
+                    print(f"🔴 Error: Checksum mismatch for archived story '{story_id}', skipping.")
+                    summary["checksum_failures"] += 1
+                    continue
+                try:
+                    panels = json.loads(story_bytes)
+                except json.JSONDecodeError as e:
+                    print(f"🔴 Error: Archived story '{story_id}' is not valid JSON ({e}), skipping.")
+                    summary["skipped_members"] += 1
+                    continue
+                if not isinstance(panels, list):
+                    summary["skipped_members"] += 1
+                    continue
+                missing_images = failed_images.intersection(get_panel_image_filenames(panels))
+                if missing_images:
+                    print(f"🔴 Error: Archived story '{story_id}' references images that failed verification {sorted(missing_images)}, skipping.")
+                    summary["stories_skipped_missing_images"] += 1
+                    continue
+                write_story_bytes_atomically(story_id, story_bytes)
+                summary["stories_imported"] += 1
+
+            elif member.name.startswith(ARCHIVE_PANELS_PREFIX):
+                image_filename = member.name[len(ARCHIVE_PANELS_PREFIX):]
+                if not PANEL_IMAGE_NAME_PATTERN.match(image_filename):
+                    summary["skipped_members"] += 1
+                    continue
+                outcome = import_panel_image_from_archive(member_file, image_filename, expected_sha256)
+                if outcome == "checksum_mismatch":
+                    print(f"🔴 Error: Checksum mismatch for archived image '{image_filename}', skipping.")
+                    summary["checksum_failures"] += 1
+                    failed_images.add(image_filename)
+                elif outcome == "conflict":
+                    print(f"⚠️ Warning: Image '{image_filename}' already exists with different content, keeping the existing one.")
+                    summary["images_conflicting"] += 1
+                    # Stories referencing it would show the local picture instead of their own
+                    failed_images.add(image_filename)
+                else:
+                    summary[f"images_{outcome}"] += 1
+            else:
+                summary["skipped_members"] += 1
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """FastAPI dependency guarding the /admin endpoints with the ADMIN_TOKEN shared secret."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled: ADMIN_TOKEN is not configured.")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid X-Admin-Token header.")
+
+
 # --- FastAPI App Definition ---
 app = FastAPI(title="ComicFlow AI API")
 
@@ -346,6 +959,11 @@ app.mount("/static/panels", StaticFiles(directory=IMAGE_OUTPUT_DIR, html=False),
 # --- Pydantic Models for Request/Response ---
 class PanelInput(BaseModel):
     user_story_input: str
+    num_image_candidates: int = Field(1, ge=1, le=MAX_IMAGE_CANDIDATES)
+    image_deadline_seconds: Optional[float] = Field(
+        None, gt=0,
+        description=f"Deadline for image generation. Defaults to {DEFAULT_IMAGE_DEADLINE_SECONDS}s when more than one candidate is requested, and to no deadline for a single candidate."
+    )
 
 class PanelResponse(BaseModel):
     panel_number: int
@@ -354,6 +972,10 @@ class PanelResponse(BaseModel):
     ai_dialogue: Optional[str] = None
     ai_sound_effect: Optional[str] = None
     image_url: str
+    alternate_image_urls: List[str] = []
+
+class PanelImageSelectionInput(BaseModel):
+    image_url: str
 
 class StoryResponse(BaseModel):
     story_id: str
@@ -366,19 +988,45 @@ class AISuggestionResponse(BaseModel):
     story_id: str
     suggestion: str
 
+class ImportSummaryResponse(BaseModel):
+    stories_imported: int
+    images_imported: int
+    images_deduplicated: int
+    images_conflicting: int
+    checksum_failures: int
+    stories_skipped_missing_images: int
+    skipped_members: int
+
+class RefinementStatsResponse(BaseModel):
+    calls: int
+    parsed_first_try: int
+    repaired: int
+    unparseable: int
+    retried_missing_fields: int
+    failed: int
+    api_errors: int
+    unparseable_rate: float
+    failure_rate: float
+
 
 # --- API Endpoints ---
 @app.post("/stories/{story_id}/panels", response_model=PanelResponse, status_code=201)
-async def add_panel_to_story(
+def add_panel_to_story(
     story_id: str = FastApiPath(..., title="The ID of the story to add a panel to", min_length=1, max_length=50, regex="^[a-zA-Z0-9_-]+$"),
     panel_input: PanelInput = Body(...)
 ):
     """
     Adds a new panel to an existing story or creates a new story if story_id is new.
     The AI will generate narration, dialogue (if any), and a comic-style image for the panel.
+    Declared without async so the blocking LLM and image calls run in the threadpool, not on the event loop.
     """
     
-    new_panel = create_new_comic_panel_logic(story_id, panel_input.user_story_input)
+    new_panel = create_new_comic_panel_logic(
+        story_id,
+        panel_input.user_story_input,
+        num_image_candidates=panel_input.num_image_candidates,
+        image_deadline_seconds=panel_input.image_deadline_seconds
+    )
 
     if not new_panel:
         raise HTTPException(status_code=500, detail="Failed to generate comic panel due to an internal AI or processing error.")
@@ -390,10 +1038,41 @@ async def add_panel_to_story(
         ai_narration=new_panel["ai_narration"],
         ai_dialogue=new_panel.get("ai_dialogue"),
         ai_sound_effect=new_panel.get("ai_sound_effect"),
-        image_url=new_panel["image_url"]
+        image_url=new_panel["image_url"],
+        alternate_image_urls=new_panel.get("alternate_image_urls", [])
     )
     return response_panel
 
+@app.put("/stories/{story_id}/panels/{panel_number}/image", response_model=PanelResponse)
+async def select_panel_image(
+    story_id: str = FastApiPath(..., title="The ID of the story the panel belongs to", min_length=1, max_length=50, regex="^[a-zA-Z0-9_-]+$"),
+    panel_number: int = FastApiPath(..., title="The number of the panel to update", ge=1),
+    selection: PanelImageSelectionInput = Body(...)
+):
+    """
+    Switches a panel's image to one of its alternate image candidates.
+    The text model is not called again.
+    """
+    panels_data = load_story_from_json(story_id)
+    if not panels_data:
+        raise HTTPException(status_code=404, detail=f"Story with ID '{story_id}' not found.")
+    if not any(p.get("panel_number") == panel_number for p in panels_data):
+        raise HTTPException(status_code=404, detail=f"Panel {panel_number} not found in story '{story_id}'.")
+
+    updated_panel = select_alternate_panel_image(story_id, panel_number, selection.image_url)
+    if not updated_panel:
+        raise HTTPException(status_code=400, detail=f"'{selection.image_url}' is not an alternate image of panel {panel_number}.")
+
+    return PanelResponse(
+        panel_number=updated_panel["panel_number"],
+        user_input=updated_panel["user_input"],
+        ai_narration=updated_panel["ai_narration"],
+        ai_dialogue=updated_panel.get("ai_dialogue"),
+        ai_sound_effect=updated_panel.get("ai_sound_effect"),
+        image_url=updated_panel["image_url"],
+        alternate_image_urls=updated_panel.get("alternate_image_urls", [])
+    )
+
 @app.get("/stories/{story_id}", response_model=StoryResponse)
 async def get_story_panels(
     story_id: str = FastApiPath(..., title="The ID of the story to retrieve", min_length=1, max_length=50, regex="^[a-zA-Z0-9_-]+$")
@@ -413,7 +1092,8 @@ async def get_story_panels(
             ai_narration=p["ai_narration"],
             ai_dialogue=p.get("ai_dialogue"),
             ai_sound_effect=p.get("ai_sound_effect"),
-            image_url=p["image_url"] # Assuming image_url is already stored correctly
+            image_url=p["image_url"], # Assuming image_url is already stored correctly
+            alternate_image_urls=p.get("alternate_image_urls", [])
         ) for p in panels_data
     ]
     return StoryResponse(story_id=story_id, panels=response_panels)
@@ -457,6 +1137,71 @@ async def get_director_suggestion_for_story(
     return AISuggestionResponse(story_id=story_id, suggestion=suggestion)
 
 
+@app.get("/stats/refinement", response_model=RefinementStatsResponse)
+async def get_refinement_stats():
+    """
+    Reports how the panel refinement LLM responses were parsed since startup:
+    first try, repaired, unparseable, needing a targeted retry, or failed.
+    Rates are relative to calls that did not end in an API error.
+    """
+    parsed_calls = refinement_parse_stats["calls"] - refinement_parse_stats["api_errors"]
+    unparseable_rate = refinement_parse_stats["unparseable"] / parsed_calls if parsed_calls > 0 else 0.0
+    failure_rate = refinement_parse_stats["failed"] / parsed_calls if parsed_calls > 0 else 0.0
+    return RefinementStatsResponse(**refinement_parse_stats, unparseable_rate=unparseable_rate, failure_rate=failure_rate)
+
+
+@app.get("/admin/export", dependencies=[Depends(require_admin_token)])
+def export_stories_archive():
+    """
+    Streams a tar archive of all stories and the panel images they reference,
+    suitable for backups or for POST /admin/import on another deployment.
+    """
+    return StreamingResponse(
+        iter_story_archive(),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": 'attachment; filename="comicflow_export.tar"'}
+    )
+
+@app.post("/admin/import", response_model=ImportSummaryResponse, dependencies=[Depends(require_admin_token)])
+async def import_stories_archive(request: Request):
+    """
+    Ingests a tar archive produced by GET /admin/export from the raw request body.
+    The body is parsed while it is being received, so the archive is never held in memory.
+    """
+    loop = asyncio.get_running_loop()
+    chunk_queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=16)
+    import_future = loop.run_in_executor(None, import_story_archive, _QueueReader(chunk_queue))
+
+    async def feed_queue(chunk: Optional[bytes]) -> bool:
+        # Poll instead of blocking so a failed import cannot stall the event loop
+        while not import_future.done():
+            try:
+                chunk_queue.put_nowait(chunk)
+                return True
+            except queue.Full:
+                await asyncio.sleep(0.01)
+        return False
+
+    try:
+        async for chunk in request.stream():
+            if chunk and not await feed_queue(chunk):
+                break
+    finally:
+        await feed_queue(None)
+
+    try:
+        summary, archive_error = await import_future
+    except Exception as e:
+        print(f"🔴 Error during archive import: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not import the archive: {e}")
+    if archive_error:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": f"Invalid or truncated export archive: {archive_error}", "partial_import": summary}
+        )
+    return ImportSummaryResponse(**summary)
+
+
 # --- Root endpoint for basic check ---
 @app.get("/")
 async def root():